@@ -2,7 +2,7 @@ import os
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import FileResponse
 from fastapi_keycloak import OIDCUser
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime
 from pydantic import BaseModel, EmailStr
 from typing import Optional
@@ -302,8 +302,13 @@ def bulk_delete_reports(
     if not db_user:
         raise HTTPException(status_code=403, detail="User not found")
     
-    # Fetch reports
-    reports = db.query(Report).filter(Report.uuid.in_(uuids)).all()
+    # Fetch reports together with their scans for the ownership check
+    reports = (
+        db.query(Report)
+        .filter(Report.uuid.in_(uuids))
+        .options(selectinload(Report.scan))
+        .all()
+    )
 
     deleted = []
 
@@ -2,9 +2,10 @@ import uuid
 import asyncio
 import json
 import redis
-import requests
+import httpx
 import re
 import ipaddress
+from functools import lru_cache
 from urllib.parse import urlparse
 
 from fastapi import APIRouter, Depends, Request, HTTPException, WebSocket, WebSocketDisconnect
@@ -30,6 +31,7 @@ router = APIRouter()
 log = get_logger(__name__)
 
 
+@lru_cache(maxsize=1024)
 def is_private_ip(ip_str):
     try:
         ip = ipaddress.ip_address(ip_str)
@@ -275,7 +277,7 @@ async def scan_hook(request: Request, db: Session = Depends(get_db)):
         # Update scan final status in DB
         scan = db.query(Scan).filter_by(uuid=scan_id).first()
         if scan:
-            scan.status = scan_status
+            scan.status = ScanStatus(scan_status)
             db.commit()
             db.refresh(scan)
             log.info(f"Scan {scan_id} updated in DB with status {scan_status}")
@@ -660,6 +662,17 @@ def create_scan_entry(inserted_targets, db_user, payload, db):
     log.info(f"Scan created in DB with id: {new_scan.id} with targets: {[t.name for t in inserted_targets]}")
 
 
+def post_openfaas_job(payload, headers):
+    """
+    Submit a scan payload to the asynchronous OpenFaaS function.
+    """
+    return httpx.post(
+        settings.OPENFAAS_ASYNC_FUNCTION_URL,
+        json=payload,
+        headers=headers,
+        timeout=30
+    )
+
 def start_openfaas_job(payload):
     scan_uuid = payload.get("scan_id")
     scan_options = payload.get("scan_options")
@@ -689,12 +702,7 @@ def start_openfaas_job(payload):
         log.error(f"Error initializing Redis for scan {scan_uuid}: {e}")
         
     try:
-        response = requests.post(
-            settings.OPENFAAS_ASYNC_FUNCTION_URL,
-            json=faas_payload,
-            headers=headers,
-            timeout=30
-        )
+        response = post_openfaas_job(faas_payload, headers)
         if response.status_code != 202:
             raise HTTPException(status_code=500, detail=f"Failed to start OpenFaaS job: {response}")
         log.info(f"OpenFaaS job started: {response}")
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi_keycloak import OIDCUser
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from app.api.dependencies import idp
@@ -21,6 +22,16 @@ router = APIRouter()
 log = get_logger(__name__)
 
 
+def resolve_target_ip(hostname):
+    """
+    Resolve a target name to an IPv4 address, or None if it does not resolve.
+    """
+    try:
+        return socket.gethostbyname(hostname)
+    except socket.gaierror:
+        return None
+
+
 @router.get("/")
 def get_targets(user: OIDCUser = Depends(idp.get_current_user()), db: Session = Depends(get_db)):
     """
@@ -31,26 +42,36 @@ def get_targets(user: OIDCUser = Depends(idp.get_current_user()), db: Session =
     if not db_user:
         raise HTTPException(status_code=403, detail="User not found")
     
+    # Count findings and completed scans per target as correlated subqueries,
+    # so the whole list comes back in a single query
+    findings_subq = (
+        select(func.count(Finding.id))
+        .where(Finding.target_id == Target.id)
+        .correlate(Target)
+        .scalar_subquery()
+    )
+    completed_scans_subq = (
+        select(func.count(Scan.id))
+        .join(scan_target_association)
+        .where(
+            scan_target_association.c.target_id == Target.id,
+            Scan.status == ScanStatus.COMPLETED
+        )
+        .correlate(Target)
+        .scalar_subquery()
+    )
+
     # Get all targets for this user
-    targets = db.query(Target).filter_by(user_id=db_user.id).order_by(Target.created_at.desc()).all()
+    targets = (
+        db.query(Target, findings_subq, completed_scans_subq)
+        .filter(Target.user_id == db_user.id)
+        .order_by(Target.created_at.desc())
+        .all()
+    )
     
     # Format target data for frontend
     target_list = []
-    for target in targets:
-        # Count findings for this target
-        findings_count = db.query(Finding).filter_by(target_id=target.id).count()
-        
-        # Count completed scans for this target
-        completed_scans_count = (
-            db.query(Scan)
-            .join(scan_target_association)
-            .filter(
-                scan_target_association.c.target_id == target.id,
-                Scan.status == ScanStatus.COMPLETED
-            )
-            .count()
-        )
-        
+    for target, findings_count, completed_scans_count in targets:
         target_info = {
             "id": target.id,
             "uuid": target.uuid,
@@ -113,9 +134,8 @@ async def get_target_flag(
     if not target:
         raise HTTPException(status_code=404, detail="Target not found")
     
-    try:
-        ip_address = socket.gethostbyname(target.name)
-    except socket.gaierror:
+    ip_address = resolve_target_ip(target.name)
+    if ip_address is None:
         return None
 
     try:
@@ -1,41 +1,98 @@
 import pytest
-from unittest.mock import patch, Mock
+from unittest.mock import Mock
 from fastapi import status
+from sqlalchemy import func, select
+
+from app.models.user import User
+
+
+def full_keycloak_user(mock_keycloak_user):
+    """Keycloak user with every profile field populated."""
+    return mock_keycloak_user
+
+
+def partial_keycloak_user(mock_keycloak_user):
+    """Keycloak user with some profile fields missing."""
+    partial_user = Mock()
+    partial_user.id = "partial-user-123"
+    partial_user.username = "partialuser"
+    partial_user.firstName = None
+    partial_user.lastName = None
+    partial_user.enabled = True
+    partial_user.emailVerified = False
+    partial_user.email = "partial@example.com"
+    return partial_user
+
+
+def missing_keycloak_user(mock_keycloak_user):
+    """Keycloak lookup that finds no user."""
+    return None
+
+
+def assert_user_matches(db, kc_user):
+    """Assert the synced DB user mirrors the Keycloak user, in a single SELECT."""
+    row = db.execute(
+        select(
+            User.keycloak_uuid,
+            User.username,
+            User.first_name,
+            User.last_name,
+            User.email,
+            User.enabled,
+            User.email_verified,
+        ).where(User.keycloak_uuid == kc_user.id)
+    ).one()
+    assert tuple(row) == (
+        kc_user.id,
+        kc_user.username,
+        kc_user.firstName,
+        kc_user.lastName,
+        kc_user.email,
+        kc_user.enabled,
+        kc_user.emailVerified,
+    )
 
 
 class TestAuthRoutes:
     """Test cases for authentication routes."""
 
-    def test_sync_user_callback_creates_new_user(
-        self, 
-        authenticated_client, 
-        test_db, 
-        mock_oidc_user, 
-        mock_keycloak_user
+    @pytest.mark.parametrize(
+        "kc_user_factory,expected_status,assert_fn",
+        [
+            (full_keycloak_user, status.HTTP_200_OK, assert_user_matches),
+            (partial_keycloak_user, status.HTTP_200_OK, assert_user_matches),
+            (missing_keycloak_user, status.HTTP_402_PAYMENT_REQUIRED, None),
+        ],
+        ids=["creates_new_user", "partial_keycloak_data", "keycloak_user_not_found"],
+    )
+    @pytest.mark.asyncio
+    async def test_sync_user_callback(
+        self,
+        async_client,
+        test_db,
+        set_idp,
+        mock_oidc_user,
+        mock_keycloak_user,
+        kc_user_factory,
+        expected_status,
+        assert_fn
     ):
-        """Test that user callback creates a new user when user doesn't exist."""
-        
-        with patch('app.api.routes.auth.idp.get_current_user', return_value=mock_oidc_user):
-            with patch('app.api.routes.auth.idp.get_user', return_value=mock_keycloak_user):
-                response = authenticated_client.get("/api/auth/callback")
-        
-        assert response.status_code == status.HTTP_200_OK
-        
-        # Verify user was created in database
-        from app.models.user import User
-        user = test_db.query(User).filter(User.keycloak_uuid == mock_keycloak_user.id).first()
-        assert user is not None
-        assert user.username == mock_keycloak_user.username
-        assert user.first_name == mock_keycloak_user.firstName
-        assert user.last_name == mock_keycloak_user.lastName
-        assert user.email == mock_keycloak_user.email
-        assert user.enabled == mock_keycloak_user.enabled
-        assert user.email_verified == mock_keycloak_user.emailVerified
+        """Test that the user callback syncs the Keycloak user into the database."""
+        kc_user = kc_user_factory(mock_keycloak_user)
+
+        set_idp(current_user=mock_oidc_user, kc_user=kc_user)
+        response = await async_client.get("/api/auth/callback")
+
+        assert response.status_code == expected_status
+        if assert_fn:
+            assert_fn(test_db, kc_user)
 
-    def test_sync_user_callback_returns_existing_user(
+    @pytest.mark.asyncio
+    async def test_sync_user_callback_returns_existing_user(
         self, 
-        authenticated_client, 
+        async_client, 
         test_db, 
+        set_idp,
         sample_user, 
         mock_oidc_user, 
         mock_keycloak_user
@@ -43,36 +100,17 @@ class TestAuthRoutes:
         """Test that user callback returns existing user when user already exists."""
         
         # User already exists (sample_user fixture)
-        original_user_count = test_db.query(sample_user.__class__).count()
-        
-        with patch('app.api.routes.auth.idp.get_current_user', return_value=mock_oidc_user):
-            with patch('app.api.routes.auth.idp.get_user', return_value=mock_keycloak_user):
-                response = authenticated_client.get("/api/auth/callback")
+        set_idp(current_user=mock_oidc_user, kc_user=mock_keycloak_user)
+        response = await async_client.get("/api/auth/callback")
         
         assert response.status_code == status.HTTP_200_OK
         
         # Verify no new user was created
-        final_user_count = test_db.query(sample_user.__class__).count()
-        assert final_user_count == original_user_count
-
-    def test_sync_user_callback_handles_keycloak_user_not_found(
-        self, 
-        authenticated_client, 
-        mock_oidc_user
-    ):
-        """Test that callback handles case when Keycloak user is not found."""
-        
-        with patch('app.api.routes.auth.idp.get_current_user', return_value=mock_oidc_user):
-            with patch('app.api.routes.auth.idp.get_user', return_value=None):
-                response = authenticated_client.get("/api/auth/callback")
-        
-        assert response.status_code == status.HTTP_402_PAYMENT_REQUIRED
-
+        assert test_db.query(func.count(User.id)).scalar() == 1
 
     def test_get_or_create_db_user_function(self, test_db, mock_keycloak_user):
         """Test the get_or_create_db_user utility function directly."""
         from app.api.routes.auth import get_or_create_db_user
-        from app.models.user import User
         
         # Test creating new user
         user = get_or_create_db_user(mock_keycloak_user, test_db)
@@ -85,70 +123,31 @@ class TestAuthRoutes:
         assert existing_user.id == user.id
         assert test_db.query(User).count() == 1
 
-    def test_sync_user_without_authentication(self, client):
+    def test_sync_user_without_authentication(self, unauthenticated_client):
         """Test that callback requires authentication."""
-        # This should fail without authentication mocks
-        response = client.get("/api/auth/callback")
-        # The exact status code depends on your authentication setup
-        # It might be 401, 403, or redirect to login
-        assert response.status_code in [200, 401, 403, 422]  # 422 for missing dependencies
-
-    def test_sync_user_with_partial_keycloak_data(
-        self, 
-        authenticated_client, 
-        test_db, 
-        mock_oidc_user
-    ):
-        """Test user creation with partial Keycloak user data."""
-        
-        # Create a mock Keycloak user with some missing fields
-        partial_keycloak_user = Mock()
-        partial_keycloak_user.id = "partial-user-123"
-        partial_keycloak_user.username = "partialuser"
-        partial_keycloak_user.firstName = None
-        partial_keycloak_user.lastName = None
-        partial_keycloak_user.enabled = True
-        partial_keycloak_user.emailVerified = False
-        partial_keycloak_user.email = "partial@example.com"
-        
-        with patch('app.api.routes.auth.idp.get_current_user', return_value=mock_oidc_user):
-            with patch('app.api.routes.auth.idp.get_user', return_value=partial_keycloak_user):
-                response = authenticated_client.get("/api/auth/callback")
-        
-        assert response.status_code == status.HTTP_200_OK
-        
-        # Verify user was created with available data
-        from app.models.user import User
-        user = test_db.query(User).filter(User.keycloak_uuid == partial_keycloak_user.id).first()
-        assert user is not None
-        assert user.username == partial_keycloak_user.username
-        assert user.first_name is None
-        assert user.last_name is None
-        assert user.email == partial_keycloak_user.email
+        response = unauthenticated_client.get("/api/auth/callback")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
-    def test_sync_user_callback_idempotent(
+    @pytest.mark.asyncio
+    async def test_sync_user_callback_idempotent(
         self, 
-        authenticated_client, 
+        async_client, 
         test_db, 
+        set_idp,
         mock_oidc_user, 
         mock_keycloak_user
     ):
         """Test that multiple calls to callback are idempotent."""
         
-        with patch('app.api.routes.auth.idp.get_current_user', return_value=mock_oidc_user):
-            with patch('app.api.routes.auth.idp.get_user', return_value=mock_keycloak_user):
-                
-                # First call
-                response1 = authenticated_client.get("/api/auth/callback")
-                assert response1.status_code == status.HTTP_200_OK
-                
-                from app.models.user import User
-                user_count_after_first = test_db.query(User).count()
-                
-                # Second call
-                response2 = authenticated_client.get("/api/auth/callback")
-                assert response2.status_code == status.HTTP_200_OK
-                
-                # Should not create duplicate user
-                user_count_after_second = test_db.query(User).count()
-                assert user_count_after_first == user_count_after_second 
\ No newline at end of file
+        set_idp(current_user=mock_oidc_user, kc_user=mock_keycloak_user)
+
+        # First call
+        response1 = await async_client.get("/api/auth/callback")
+        assert response1.status_code == status.HTTP_200_OK
+        
+        # Second call
+        response2 = await async_client.get("/api/auth/callback")
+        assert response2.status_code == status.HTTP_200_OK
+        
+        # Should not create duplicate user
+        assert test_db.query(func.count(User.id)).scalar() == 1 
\ No newline at end of file
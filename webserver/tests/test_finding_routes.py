@@ -1,15 +1,73 @@
 import pytest
 from unittest.mock import patch, Mock
 from fastapi import status
+from fastapi.routing import APIRoute
 import json
 
-from app.models.user import User
+from app.api.dependencies import idp
+from app.main import api_app
 from app.models.target import Target
 from app.models.finding import Finding, Severity
 
 
+EVIDENCE = {"nmap_output": "Port 80 open", "banner": "Apache 2.4"}
+JSON_EVIDENCE = json.dumps(EVIDENCE)
+
+# (value sent in the update, value expected back) for every assignable severity
+SEVERITY_UPDATES = [
+    (severity.value.upper(), severity.value)
+    for severity in (Severity.LOW, Severity.MEDIUM, Severity.HIGH, Severity.CRITICAL)
+]
+
+
+@pytest.fixture
+def other_user_with_finding(test_db, user_factory):
+    """Another user's target and finding, for cross-user access checks."""
+    other_user = user_factory()
+    other_target = Target(name="other-target.com", user_id=other_user.id)
+    other_finding = Finding(
+        name="Other Finding",
+        description="Other description",
+        severity=Severity.HIGH,
+        target=other_target,
+        port=443,
+        service="https"
+    )
+    test_db.add(other_finding)
+    test_db.flush()
+    return other_user, other_target, other_finding
+
+
+# Paths as registered on the mounted API app (i.e. without the /api prefix)
+PROTECTED_ROUTES = [
+    ("GET", "/findings/"),
+    ("GET", "/findings/{finding_uuid}"),
+    ("PUT", "/findings/{finding_uuid}"),
+    ("DELETE", "/findings/{finding_uuid}"),
+    ("POST", "/findings/bulk-delete"),
+    ("GET", "/findings/by-target/{target_uuid}"),
+]
+
+
+def stub_first_results(mock_db, *results):
+    """Make successive ``db.query(...).filter_by(...).first()`` calls return results in order."""
+    mock_db.query.return_value.filter_by.return_value.first.side_effect = list(results)
+
+
+def find_route(method, path):
+    return next(
+        route for route in api_app.routes
+        if isinstance(route, APIRoute) and route.path == path and method in route.methods
+    )
+
+
 class TestFindingRoutes:
-    """Test cases for finding routes."""
+    """Test cases for finding routes.
+
+    Tests that only use the mocked session are marked ``xdist_group("findings_ro")``
+    and stay on one worker under ``pytest -n auto --dist loadgroup``; the
+    database-backed tests are left ungrouped and spread across workers.
+    """
 
     def test_get_findings_empty_list(self, authenticated_client, sample_user):
         """Test getting findings when user has no findings."""
@@ -20,11 +78,14 @@ class TestFindingRoutes:
         assert "data" in data
         assert data["data"] == []
 
-    def test_get_findings_with_data(self, authenticated_client, sample_user, sample_finding, test_db):
+    def test_get_findings_with_data(self, authenticated_client, sample_user, sample_finding, sql_counter):
         """Test getting findings when user has findings."""
+        sql_counter.clear()
         response = authenticated_client.get("/api/findings/")
         
         assert response.status_code == status.HTTP_200_OK
+        # User, targets and findings; the target of each finding must not be lazy-loaded
+        assert sql_counter.select_count <= 3
         data = response.json()
         assert "data" in data
         assert len(data["data"]) == 1
@@ -39,38 +100,8 @@ class TestFindingRoutes:
         assert finding_data["service"] == sample_finding.service
         assert "target" in finding_data
 
-    def test_get_findings_only_user_findings(self, authenticated_client, sample_user, test_db):
+    def test_get_findings_only_user_findings(self, authenticated_client, sample_user, other_user_with_finding):
         """Test that users only see their own findings."""
-        from app.models.user import User
-        from app.models.target import Target
-        from app.models.finding import Finding, Severity
-        
-        # Create another user and their target/finding
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_target = Target(name="other-target.com", user_id=other_user.id)
-        test_db.add(other_target)
-        test_db.commit()
-        test_db.refresh(other_target)
-        
-        other_finding = Finding(
-            name="Other Finding",
-            description="Other description",
-            severity=Severity.HIGH,
-            target_id=other_target.id,
-            port=443,
-            service="https"
-        )
-        test_db.add(other_finding)
-        test_db.commit()
-        
         response = authenticated_client.get("/api/findings/")
         
         assert response.status_code == status.HTTP_200_OK
@@ -94,8 +125,6 @@ class TestFindingRoutes:
 
     def test_get_finding_with_json_evidence(self, authenticated_client, sample_target, test_db):
         """Test getting a finding with JSON evidence that gets parsed."""
-        
-        json_evidence = json.dumps({"nmap_output": "Port 80 open", "banner": "Apache 2.4"})
         finding = Finding(
             name="Finding with JSON Evidence",
             description="Test finding",
@@ -103,7 +132,7 @@ class TestFindingRoutes:
             target_id=sample_target.id,
             port=80,
             service="http",
-            evidence=json_evidence
+            evidence=JSON_EVIDENCE
         )
         test_db.add(finding)
         test_db.commit()
@@ -114,9 +143,7 @@ class TestFindingRoutes:
         assert response.status_code == status.HTTP_200_OK
         data = response.json()
         # Evidence should be parsed as JSON object, not string
-        assert isinstance(data["evidence"], dict)
-        assert data["evidence"]["nmap_output"] == "Port 80 open"
-        assert data["evidence"]["banner"] == "Apache 2.4"
+        assert data["evidence"] == EVIDENCE
 
     def test_get_finding_with_invalid_json_evidence(self, authenticated_client, sample_target, test_db):
         """Test getting a finding with invalid JSON evidence."""
@@ -142,47 +169,36 @@ class TestFindingRoutes:
         # Evidence should remain as string when JSON parsing fails
         assert data["evidence"] == invalid_json
 
-    def test_get_finding_not_found(self, authenticated_client, sample_user):
+    @pytest.mark.xdist_group("findings_ro")
+    def test_get_finding_not_found(self, mock_db_client, mock_db):
         """Test getting a finding that doesn't exist."""
-        response = authenticated_client.get("/api/findings/nonexistent-uuid")
+        stub_first_results(mock_db, Mock(id=1), None)
+        
+        response = mock_db_client.get("/api/findings/nonexistent-uuid")
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert "Finding not found" in response.json()["detail"]
 
-    def test_get_finding_unauthorized(self, authenticated_client, test_db):
-        """Test getting a finding that belongs to another user."""
-        
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_target = Target(name="other-target.com", user_id=other_user.id)
-        test_db.add(other_target)
-        test_db.commit()
-        test_db.refresh(other_target)
-        
-        other_finding = Finding(
-            name="Other Finding",
-            description="Other description",
-            severity=Severity.HIGH,
-            target_id=other_target.id,
-            port=443,
-            service="https"
+    @pytest.mark.parametrize("method, path", [
+        ("GET", "/api/findings/{finding.uuid}"),
+        ("PUT", "/api/findings/{finding.uuid}"),
+        ("DELETE", "/api/findings/{finding.uuid}"),
+        ("GET", "/api/findings/by-target/{target.uuid}"),
+    ])
+    def test_cross_user_access_forbidden(self, authenticated_client, other_user_with_finding, method, path):
+        """Test that another user's finding or target cannot be read, updated or deleted."""
+        _, other_target, other_finding = other_user_with_finding
+        body = {"description": "Updated description"} if method == "PUT" else None
+        
+        response = authenticated_client.request(
+            method,
+            path.format(finding=other_finding, target=other_target),
+            json=body
         )
-        test_db.add(other_finding)
-        test_db.commit()
-        test_db.refresh(other_finding)
-        
-        response = authenticated_client.get(f"/api/findings/{other_finding.uuid}")
         
         assert response.status_code == status.HTTP_403_FORBIDDEN
 
-    def test_update_finding_success(self, authenticated_client, sample_finding, test_db, db_refresh):
+    def test_update_finding_success(self, authenticated_client, sample_finding, db_refresh):
         """Test successful finding update."""
         update_data = {
             "description": "Updated description",
@@ -201,15 +217,12 @@ class TestFindingRoutes:
         assert data["recommendation"] == update_data["recommendation"]
         assert data["severity"] == update_data["severity"].lower()
         
-        # Refresh database state to see changes made by the API call
-        db_refresh()
-        
-        # Now refetch the object to see the committed changes
-        updated_finding = test_db.query(Finding).filter(Finding.uuid == sample_finding.uuid).first()
+        # Reload just the updated columns to see the committed changes
+        db_refresh(sample_finding, ["description", "recommendation", "severity"])
 
-        assert updated_finding.description == update_data["description"]
-        assert updated_finding.recommendation == update_data["recommendation"]
-        assert updated_finding.severity.value == update_data["severity"].lower()
+        assert sample_finding.description == update_data["description"]
+        assert sample_finding.recommendation == update_data["recommendation"]
+        assert sample_finding.severity.value == update_data["severity"].lower()
 
     def test_update_finding_partial_update(self, authenticated_client, sample_finding):
         """Test partial finding update (only some fields)."""
@@ -226,69 +239,33 @@ class TestFindingRoutes:
         # Other fields should remain unchanged
         assert data["recommendation"] == sample_finding.recommendation
 
-    def test_update_finding_not_found(self, authenticated_client, test_db, sample_user):
+    @pytest.mark.xdist_group("findings_ro")
+    def test_update_finding_not_found(self, mock_db_client, mock_db):
         """Test updating a finding that doesn't exist."""
+        stub_first_results(mock_db, Mock(id=1), None)
         update_data = {"description": "Updated description"}
         
-        response = authenticated_client.put(
+        response = mock_db_client.put(
             "/api/findings/nonexistent-uuid",
             json=update_data
         )
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
-    def test_update_finding_unauthorized(self, authenticated_client, test_db, db_refresh):
-        """Test updating a finding that belongs to another user."""
-        from app.models.user import User
-        from app.models.target import Target
-        from app.models.finding import Finding, Severity
-        
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_target = Target(name="other-target.com", user_id=other_user.id)
-        test_db.add(other_target)
-        test_db.commit()
-        test_db.refresh(other_target)
-        
-        other_finding = Finding(
-            name="Other Finding",
-            description="Other description",
-            severity=Severity.HIGH,
-            target_id=other_target.id,
-            port=443,
-            service="https"
-        )
-        test_db.add(other_finding)
-        test_db.commit()
-        test_db.refresh(other_finding)
-
-        db_refresh()
-        
-        update_data = {"description": "Updated description"}
-        response = authenticated_client.put(
-            f"/api/findings/{other_finding.uuid}",
-            json=update_data
-        )
-        
-        assert response.status_code == status.HTTP_403_FORBIDDEN
-
-    def test_update_finding_invalid_severity(self, authenticated_client, sample_finding):
+    @pytest.mark.xdist_group("findings_ro")
+    def test_update_finding_invalid_severity(self, mock_db_client, mock_db):
         """Test updating finding with invalid severity value."""
+        owner = Mock(id=1)
+        finding = Mock(uuid="finding-uuid", target=Mock(user_id=owner.id))
+        stub_first_results(mock_db, owner, finding)
         update_data = {"severity": "INVALID_SEVERITY"}
         
         # This will cause a ValueError in the route because the Severity enum
         # doesn't accept invalid values. This should be caught by FastAPI
         # and converted to a proper HTTP error response
         try:
-            response = authenticated_client.put(
-                f"/api/findings/{sample_finding.uuid}",
+            response = mock_db_client.put(
+                f"/api/findings/{finding.uuid}",
                 json=update_data
             )
             # If we get here, the route handled the error gracefully
@@ -313,64 +290,25 @@ class TestFindingRoutes:
         finding = test_db.query(Finding).filter(Finding.uuid == finding_uuid).first()
         assert finding is None
 
-    def test_delete_finding_not_found(self, authenticated_client, sample_user):
+    @pytest.mark.xdist_group("findings_ro")
+    def test_delete_finding_not_found(self, mock_db_client, mock_db):
         """Test deleting a finding that doesn't exist."""
-        response = authenticated_client.delete("/api/findings/nonexistent-uuid")
-        
-        assert response.status_code == status.HTTP_404_NOT_FOUND
-
-    def test_delete_finding_unauthorized(self, authenticated_client, test_db, db_refresh):
-        """Test deleting a finding that belongs to another user."""
-        from app.models.user import User
-        from app.models.target import Target
-        from app.models.finding import Finding, Severity
+        stub_first_results(mock_db, Mock(id=1), None)
         
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
+        response = mock_db_client.delete("/api/findings/nonexistent-uuid")
         
-        other_target = Target(name="other-target.com", user_id=other_user.id)
-        test_db.add(other_target)
-        test_db.commit()
-        test_db.refresh(other_target)
-        
-        other_finding = Finding(
-            name="Other Finding",
-            description="Other description",
-            severity=Severity.HIGH,
-            target_id=other_target.id,
-            port=443,
-            service="https"
-        )
-        test_db.add(other_finding)
-        test_db.commit()
-        test_db.refresh(other_finding)
-
-        db_refresh()
-        
-        response = authenticated_client.delete(f"/api/findings/{other_finding.uuid}")
-        
-        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert response.status_code == status.HTTP_404_NOT_FOUND
 
-    def test_bulk_delete_findings_success(self, authenticated_client, sample_user, sample_target, test_db, db_refresh):
+    def test_bulk_delete_findings_success(self, authenticated_client, sample_user, sample_target, test_db, bulk_insert, db_refresh):
         """Test successful bulk deletion of findings."""
         
-        findings = [
-            Finding(name="Finding 1", description="Desc 1", severity=Severity.HIGH, target_id=sample_target.id, port=80),
-            Finding(name="Finding 2", description="Desc 2", severity=Severity.MEDIUM, target_id=sample_target.id, port=443),
-            Finding(name="Finding 3", description="Desc 3", severity=Severity.LOW, target_id=sample_target.id, port=22)
-        ]
-        test_db.add_all(findings)
-        test_db.commit()
-        for finding in findings:
-            test_db.refresh(finding)
+        rows = bulk_insert(Finding, [
+            {"name": "Finding 1", "description": "Desc 1", "severity": Severity.HIGH, "target_id": sample_target.id, "port": 80},
+            {"name": "Finding 2", "description": "Desc 2", "severity": Severity.MEDIUM, "target_id": sample_target.id, "port": 443},
+            {"name": "Finding 3", "description": "Desc 3", "severity": Severity.LOW, "target_id": sample_target.id, "port": 22}
+        ], Finding.uuid)
         
-        finding_uuids = [finding.uuid for finding in findings]
+        finding_uuids = [row.uuid for row in rows]
         
         response = authenticated_client.post("/api/findings/bulk-delete", json=finding_uuids)
         
@@ -389,61 +327,41 @@ class TestFindingRoutes:
         
         assert response.status_code == status.HTTP_200_OK
 
-    def test_get_findings_by_target_success(self, authenticated_client, sample_user, sample_target, test_db, db_refresh):
+    def test_get_findings_by_target_success(self, authenticated_client, sample_user, sample_target, bulk_insert, sql_counter):
         """Test getting findings for a specific target."""
         
-        # Create multiple findings for the target
-        findings = [
-            Finding(name="Finding 1", description="Desc 1", severity=Severity.HIGH, target_id=sample_target.id, port=80),
-            Finding(name="Finding 2", description="Desc 2", severity=Severity.MEDIUM, target_id=sample_target.id, port=443)
-        ]
-        test_db.add_all(findings)
-        test_db.commit()
-
-        db_refresh()
+        # Create multiple findings for the target; RETURNING hands back the keys
+        rows = bulk_insert(Finding, [
+            {"name": "Finding 1", "description": "Desc 1", "severity": Severity.HIGH, "target_id": sample_target.id, "port": 80},
+            {"name": "Finding 2", "description": "Desc 2", "severity": Severity.MEDIUM, "target_id": sample_target.id, "port": 443}
+        ], Finding.id, Finding.uuid)
         
-        response = authenticated_client.get(f"/api/findings/by-target/{sample_target.uuid}")
+        url = f"/api/findings/by-target/{sample_target.uuid}"
+        sql_counter.clear()
+        response = authenticated_client.get(url)
         
         assert response.status_code == status.HTTP_200_OK
+        # User, target and findings, independent of the number of findings
+        assert sql_counter.select_count <= 3
         data = response.json()
         assert "data" in data
-        assert len(data["data"]) == 2
+        assert {(item["id"], item["uuid"]) for item in data["data"]} == {tuple(row) for row in rows}
         
         # Verify each finding includes target_uuid
         for finding_data in data["data"]:
             assert finding_data["target_uuid"] == sample_target.uuid
             assert finding_data["target_id"] == sample_target.id
 
-    def test_get_findings_by_target_not_found(self, authenticated_client, sample_user):
+    @pytest.mark.xdist_group("findings_ro")
+    def test_get_findings_by_target_not_found(self, mock_db_client, mock_db):
         """Test getting findings for a target that doesn't exist."""
-        response = authenticated_client.get("/api/findings/by-target/nonexistent-uuid")
+        stub_first_results(mock_db, Mock(id=1), None)
+        
+        response = mock_db_client.get("/api/findings/by-target/nonexistent-uuid")
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert "Target not found" in response.json()["detail"]
 
-    def test_get_findings_by_target_unauthorized(self, authenticated_client, test_db, db_refresh, sample_user):
-        """Test getting findings for a target that belongs to another user."""
-        
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_target = Target(name="other-target.com", user_id=other_user.id)
-        test_db.add(other_target)
-        test_db.commit()
-        test_db.refresh(other_target)
-
-        db_refresh()
-        
-        response = authenticated_client.get(f"/api/findings/by-target/{other_target.uuid}")
-        
-        assert response.status_code == status.HTTP_403_FORBIDDEN
-
     def test_get_findings_by_target_empty_list(self, authenticated_client, sample_target):
         """Test getting findings for a target with no findings."""
         response = authenticated_client.get(f"/api/findings/by-target/{sample_target.uuid}")
@@ -453,42 +371,32 @@ class TestFindingRoutes:
         assert "data" in data
         assert data["data"] == []
 
-    def test_findings_require_authentication(self, client):
-        """Test that all finding endpoints require authentication."""
-        endpoints = [
-            ("GET", "/api/findings/"),
-            ("GET", "/api/findings/some-uuid"),
-            ("PUT", "/api/findings/some-uuid"),
-            ("DELETE", "/api/findings/some-uuid"),
-            ("POST", "/api/findings/bulk-delete"),
-            ("GET", "/api/findings/by-target/some-uuid"),
-        ]
-        
-        for method, endpoint in endpoints:
-            if method == "GET":
-                response = client.get(endpoint)
-            elif method == "PUT":
-                response = client.put(endpoint, json={})
-            elif method == "POST":
-                response = client.post(endpoint, json={})
-            elif method == "DELETE":
-                response = client.delete(endpoint)
-            
-            assert response.status_code in [401, 403, 422]  # Authentication required
-
-    def test_finding_severity_validation(self, authenticated_client, sample_finding):
-        """Test that severity updates are validated properly."""
-        valid_severities = ["low", "medium", "high", "critical"]
+    @pytest.mark.xdist_group("findings_ro")
+    @pytest.mark.parametrize("method, path", PROTECTED_ROUTES)
+    def test_findings_require_authentication(self, method, path):
+        """Test that all finding endpoints depend on the current user."""
+        route = find_route(method, path)
         
-        for severity in valid_severities:
-            update_data = {"severity": severity.upper()}
-            response = authenticated_client.put(
-                f"/api/findings/{sample_finding.uuid}",
-                json=update_data
-            )
-            assert response.status_code == status.HTTP_200_OK
-            data = response.json()
-            assert data["severity"] == severity  # Should be lowercase in response
+        dependencies = [dependency.call for dependency in route.dependant.dependencies]
+        assert idp.get_current_user() in dependencies
+
+    def test_findings_reject_unauthenticated_request(self, unauthenticated_client):
+        """Test that a request without a user is rejected before reaching the route."""
+        response = unauthenticated_client.get("/api/findings/")
+        
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    @pytest.mark.parametrize("sent, expected", SEVERITY_UPDATES, ids=[expected for _, expected in SEVERITY_UPDATES])
+    def test_finding_severity_validation(self, authenticated_client, sample_finding, sent, expected):
+        """Test that severity updates are validated properly."""
+        update_data = {"severity": sent}
+        response = authenticated_client.put(
+            f"/api/findings/{sample_finding.uuid}",
+            json=update_data
+        )
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["severity"] == expected  # Should be lowercase in response
 
     def test_finding_update_preserves_read_only_fields(self, authenticated_client, sample_finding):
         """Test that updating a finding doesn't change read-only fields."""
@@ -1,28 +1,127 @@
 import pytest
-from unittest.mock import patch, Mock, mock_open
+from unittest.mock import MagicMock
 from fastapi import status
-import os
-import tempfile
+import uuid
 from app.models.user import User
 from app.models.scan import Scan, ScanStatus
-from app.models.report import Report
+from app.models.report import Report, ReportStatus, ReportType
+
+
+PROTECTED_ENDPOINTS = [
+    ("GET", "/api/reports/"),
+    ("GET", "/api/reports/some-uuid"),
+    ("GET", "/api/reports/some-uuid/download"),
+    ("DELETE", "/api/reports/some-uuid"),
+    ("POST", "/api/reports/bulk-delete"),
+]
+
+
+def stub_owned_report(mock_db, report):
+    """Make the routes' report-by-uuid-and-owner lookup on mock_db return report."""
+    owned_report = mock_db.query.return_value.join.return_value.filter.return_value.filter.return_value
+    owned_report.first.return_value = report
+
+
+@pytest.fixture(scope="module")
+def _report_os():
+    """Stubs for ``os.path.exists`` and ``os.remove`` used by the report routes, installed once per module."""
+    fake_os = MagicMock()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("app.api.routes.report.os.path.exists", fake_os.path.exists)
+        mp.setattr("app.api.routes.report.os.remove", fake_os.remove)
+        yield fake_os
+
+
+@pytest.fixture(autouse=True)
+def report_os(_report_os):
+    """The shared ``os`` stubs, reset so report files are missing unless a test says otherwise."""
+    _report_os.reset_mock(return_value=True, side_effect=True)
+    _report_os.path.exists.return_value = False
+    return _report_os
+
+
+@pytest.fixture(scope="module")
+def _file_response():
+    """Stub for the FileResponse class used by the download route, installed once per module."""
+    stub = MagicMock()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("app.api.routes.report.FileResponse", stub)
+        yield stub
+
+
+@pytest.fixture
+def file_response(_file_response):
+    """The shared FileResponse stub with its recorded calls cleared."""
+    _file_response.reset_mock()
+    return _file_response
+
+
+@pytest.fixture
+def other_user_report(test_db, user_factory):
+    """Another user's scan and report, built in a single flush."""
+    other_user = user_factory()
+    other_scan = Scan(name="Other Scan", user=other_user, status=ScanStatus.COMPLETED)
+    other_report = Report(name="Other Report", scan=other_scan, status=ReportStatus.GENERATED)
+    test_db.add_all([other_scan, other_report])
+    test_db.flush()
+    return other_user, other_scan, other_report
+
+
+@pytest.fixture
+def preloaded_reports(request, test_db, sample_user):
+    """Seed reports for the state named by the parameter in a single flush.
+
+    ``owned``: one report of the current user; ``other_user``: one report of
+    another user; ``both``: one of each. Returns ``(owned, others)``.
+    """
+    state = request.param
+    owned, others = [], []
+    if state in ("owned", "both"):
+        scan = Scan(name="User Scan", user_id=sample_user.id, status=ScanStatus.COMPLETED)
+        owned.append(Report(name="User Report", scan=scan, status=ReportStatus.GENERATED))
+    if state in ("other_user", "both"):
+        other_user = User(keycloak_uuid="other-user-uuid", username="otheruser", email="other@example.com")
+        other_scan = Scan(name="Other Scan", user=other_user, status=ScanStatus.COMPLETED)
+        others.append(Report(name="Other Report", scan=other_scan, status=ReportStatus.GENERATED))
+    # Scans (and the other user) are pulled in through the relationship cascade
+    test_db.add_all(owned + others)
+    test_db.flush()
+    return owned, others
+
+
+@pytest.fixture
+def download_scan(test_db, sample_user):
+    """Completed scan that download tests attach their reports to."""
+    scan = Scan(
+        name="Test Scan",
+        user_id=sample_user.id,
+        status=ScanStatus.COMPLETED
+    )
+    test_db.add(scan)
+    test_db.flush()
+    return scan
 
 
 class TestReportRoutes:
     """Test cases for report routes."""
 
-    def test_get_reports_empty_list(self, authenticated_client, sample_user):
+    def test_get_reports_empty_list(self, mock_db_client, mock_db):
         """Test getting reports when user has no reports."""
-        response = authenticated_client.get("/api/reports/")
+        owned_reports = mock_db.query.return_value.join.return_value.filter.return_value.order_by.return_value
+        owned_reports.all.return_value = []
+        
+        response = mock_db_client.get("/api/reports/")
         
         assert response.status_code == status.HTTP_200_OK
         data = response.json()
         assert "data" in data
         assert data["data"] == []
 
-    def test_get_reports_with_data(self, authenticated_client, sample_user, sample_report, test_db):
+    @pytest.mark.usefixtures("raise_on_lazy_load")
+    @pytest.mark.asyncio
+    async def test_get_reports_with_data(self, async_client, sample_user, sample_report, test_db):
         """Test getting reports when user has reports."""
-        response = authenticated_client.get("/api/reports/")
+        response = await async_client.get("/api/reports/")
         
         assert response.status_code == status.HTTP_200_OK
         data = response.json()
@@ -37,45 +136,10 @@ class TestReportRoutes:
         assert "created_at" in report_data
         assert "updated_at" in report_data
 
-    def test_get_reports_only_user_reports(self, authenticated_client, sample_user, test_db):
-        """Test that users only see reports from their own scans."""
-        # Create another user and their scan/report
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_scan = Scan(
-            name="Other Scan",
-            user_id=other_user.id,
-            status=ScanStatus.COMPLETED
-        )
-        test_db.add(other_scan)
-        test_db.commit()
-        test_db.refresh(other_scan)
-        
-        other_report = Report(
-            name="Other Report",
-            scan_id=other_scan.id,
-            status="GENERATED"
-        )
-        test_db.add(other_report)
-        test_db.commit()
-        
-        response = authenticated_client.get("/api/reports/")
-        
-        assert response.status_code == status.HTTP_200_OK
-        data = response.json()
-        # Should not include the other user's report
-        assert len(data["data"]) == 0
-
-    def test_get_report_by_uuid_success(self, authenticated_client, sample_report):
+    @pytest.mark.asyncio
+    async def test_get_report_by_uuid_success(self, async_client, sample_report):
         """Test getting a specific report by UUID."""
-        response = authenticated_client.get(f"/api/reports/{sample_report.uuid}")
+        response = await async_client.get(f"/api/reports/{sample_report.uuid}")
         
         assert response.status_code == status.HTTP_200_OK
         data = response.json()
@@ -84,336 +148,213 @@ class TestReportRoutes:
         assert data["name"] == sample_report.name
         assert data["status"] == sample_report.status.value
 
-    def test_get_report_not_found(self, authenticated_client, sample_user, test_db):
+    def test_get_report_not_found(self, mock_db_client, mock_db):
         """Test getting a report that doesn't exist."""
-        response = authenticated_client.get("/api/reports/nonexistent-uuid")
+        stub_owned_report(mock_db, None)
+        
+        response = mock_db_client.get("/api/reports/nonexistent-uuid")
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert "Report not found" in response.json()["detail"]
 
-    def test_get_report_unauthorized(self, authenticated_client, test_db, sample_user):
-        """Test getting a report that belongs to another user."""
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_scan = Scan(
-            name="Other Scan",
-            user_id=other_user.id,
-            status=ScanStatus.COMPLETED
-        )
-        test_db.add(other_scan)
-        test_db.commit()
-        test_db.refresh(other_scan)
-        
-        other_report = Report(
-            name="Other Report",
-            scan_id=other_scan.id,
-            status="GENERATED"
-        )
-        test_db.add(other_report)
-        test_db.commit()
-        test_db.refresh(other_report)
+    @pytest.mark.parametrize("preloaded_reports, expected_len", [
+        ("owned", 1),
+        ("other_user", 0),
+        ("both", 1),
+    ], indirect=["preloaded_reports"])
+    @pytest.mark.asyncio
+    async def test_get_reports_by_state(self, async_client, preloaded_reports, expected_len):
+        """Test that the report list holds exactly the current user's reports."""
+        owned, _ = preloaded_reports
+        response = await async_client.get("/api/reports/")
         
-        response = authenticated_client.get(f"/api/reports/{other_report.uuid}")
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert len(data["data"]) == expected_len
+        assert [item["uuid"] for item in data["data"]] == [report.uuid for report in owned]
+
+    @pytest.mark.parametrize("method", ["GET", "DELETE"])
+    @pytest.mark.asyncio
+    async def test_report_of_other_user_not_found(self, async_client, sample_user, other_user_report, method):
+        """Test that another user's report cannot be read or deleted."""
+        _, _, other_report = other_user_report
+        
+        response = await async_client.request(method, f"/api/reports/{other_report.uuid}")
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
-    @patch('os.path.exists')
-    @patch('os.remove')
-    def test_delete_report_success(self, mock_remove, mock_exists, authenticated_client, sample_report, test_db, db_refresh):
+    @pytest.mark.asyncio
+    async def test_delete_report_success(self, report_os, async_client, sample_report, test_db):
         """Test successful report deletion."""
-        mock_exists.return_value = True
+        report_os.path.exists.return_value = True
         report_uuid = sample_report.uuid
         
-        response = authenticated_client.delete(f"/api/reports/{report_uuid}")
+        response = await async_client.delete(f"/api/reports/{report_uuid}")
         
         assert response.status_code == status.HTTP_200_OK
         assert "Report deleted successfully" in response.json()["message"]
 
-        db_refresh()
-        
         # Verify report was deleted from database
         report = test_db.query(Report).filter(Report.uuid == report_uuid).first()
         assert report is None
 
-    def test_delete_report_not_found(self, authenticated_client, sample_user):
+    def test_delete_report_not_found(self, mock_db_client, mock_db):
         """Test deleting a report that doesn't exist."""
-        response = authenticated_client.delete("/api/reports/nonexistent-uuid")
-        
-        assert response.status_code == status.HTTP_404_NOT_FOUND
-
-    def test_delete_report_unauthorized(self, authenticated_client, test_db, sample_user, db_refresh):
-        """Test deleting a report that belongs to another user."""
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_scan = Scan(
-            name="Other Scan",
-            user_id=other_user.id,
-            status=ScanStatus.COMPLETED
-        )
-        test_db.add(other_scan)
-        test_db.commit()
-        test_db.refresh(other_scan)
-        
-        other_report = Report(
-            name="Other Report",
-            scan_id=other_scan.id,
-            status="GENERATED"
-        )
-        test_db.add(other_report)
-        test_db.commit()
-        test_db.refresh(other_report)
+        stub_owned_report(mock_db, None)
         
-        db_refresh()
-        
-        response = authenticated_client.delete(f"/api/reports/{other_report.uuid}")
+        response = mock_db_client.delete("/api/reports/nonexistent-uuid")
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
-    def test_download_report_not_found(self, authenticated_client, sample_user):
+    def test_download_report_not_found(self, mock_db_client, mock_db):
         """Test downloading a report that doesn't exist."""
-        response = authenticated_client.get("/api/reports/nonexistent-uuid/download")
+        stub_owned_report(mock_db, None)
+        
+        response = mock_db_client.get("/api/reports/nonexistent-uuid/download")
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
-    @patch('os.path.exists')
-    def test_download_report_not_ready(self, mock_exists, authenticated_client, test_db, sample_user, db_refresh):
+    @pytest.mark.asyncio
+    async def test_download_report_not_ready(self, async_client, test_db, download_scan):
         """Test downloading a report that is not ready."""
-        scan = Scan(
-            name="Test Scan",
-            user_id=sample_user.id,
-            status=ScanStatus.COMPLETED
-        )
-        test_db.add(scan)
-        test_db.commit()
-        test_db.refresh(scan)
-        
         report = Report(
             name="Test Report",
-            scan_id=scan.id,
-            status="PENDING"  # Not generated yet
+            uuid=str(uuid.uuid4()),
+            scan_id=download_scan.id,
+            status=ReportStatus.PENDING  # Not generated yet
         )
         test_db.add(report)
-        test_db.commit()
-        test_db.refresh(report)
+        test_db.flush()
         
-        response = authenticated_client.get(f"/api/reports/{report.uuid}/download")
+        response = await async_client.get(f"/api/reports/{report.uuid}/download")
         
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert "Report is not ready for download" in response.json()["detail"]
 
-    @patch('os.path.exists')
-    def test_download_report_file_not_found(self, mock_exists, authenticated_client, test_db, sample_user, db_refresh):
+    @pytest.mark.asyncio
+    async def test_download_report_file_not_found(self, report_os, async_client, test_db, download_scan):
         """Test downloading a report when file doesn't exist."""
-        scan = Scan(
-            name="Test Scan",
-            user_id=sample_user.id,
-            status=ScanStatus.COMPLETED
-        )
-        test_db.add(scan)
-        test_db.commit()
-        test_db.refresh(scan)
-        
         report = Report(
             name="Test Report",
-            scan_id=scan.id,
-            status="GENERATED",
+            uuid=str(uuid.uuid4()),
+            scan_id=download_scan.id,
+            status=ReportStatus.GENERATED,
             url="/tmp/nonexistent-report.pdf"
         )
         test_db.add(report)
-        test_db.commit()
-        test_db.refresh(report)
+        test_db.flush()
         
-        mock_exists.return_value = False
+        report_os.path.exists.return_value = False
         
-        response = authenticated_client.get(f"/api/reports/{report.uuid}/download")
+        response = await async_client.get(f"/api/reports/{report.uuid}/download")
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert "Report file not found" in response.json()["detail"]
 
-    def test_bulk_delete_reports_success(self, authenticated_client, sample_user, test_db, db_refresh):
+    @pytest.mark.usefixtures("raise_on_lazy_load")
+    @pytest.mark.asyncio
+    async def test_bulk_delete_reports_success(self, async_client, sample_user, test_db, bulk_insert, sql_counter):
         """Test successful bulk deletion of reports."""
-        # Create scan
-        scan = Scan(
-            name="Test Scan",
-            user_id=sample_user.id,
-            status=ScanStatus.COMPLETED
-        )
-        test_db.add(scan)
-        test_db.commit()
-        test_db.refresh(scan)
-        
-        # Create reports
-        reports = [
-            Report(name="Report 1", scan_id=scan.id, status="GENERATED"),
-            Report(name="Report 2", scan_id=scan.id, status="GENERATED"),
-            Report(name="Report 3", scan_id=scan.id, status="GENERATED")
-        ]
-        test_db.add_all(reports)
-        test_db.commit()
-        for report in reports:
-            test_db.refresh(report)
-
-        db_refresh()
-        
-        report_uuids = [report.uuid for report in reports]
-        
-        response = authenticated_client.post("/api/reports/bulk-delete", json=report_uuids)
+        # Create reports on separate scans straight through Core, so nothing
+        # is cached in the session and lazy loads would show up
+        scan_ids = bulk_insert(Scan, [
+            {"name": f"Test Scan {i}", "user_id": sample_user.id, "status": ScanStatus.COMPLETED}
+            for i in range(1, 4)
+        ], Scan.id)
+        rows = bulk_insert(Report, [
+            {"name": f"Report {i}", "scan_id": scan_id, "status": ReportStatus.GENERATED}
+            for i, (scan_id,) in enumerate(scan_ids, start=1)
+        ], Report.uuid)
+        
+        report_uuids = [row.uuid for row in rows]
+        sql_counter.clear()
+        
+        response = await async_client.post("/api/reports/bulk-delete", json=report_uuids)
         
         assert response.status_code == status.HTTP_200_OK
         assert "3 report(s) deleted successfully" in response.json()["message"]
+        # User, reports and their scans (plus the user reload after commit),
+        # not one scan query per report
+        assert sql_counter.select_count <= 4
 
-        db_refresh()
-        
         # Verify reports were deleted
         remaining_reports = test_db.query(Report).filter(Report.uuid.in_(report_uuids)).all()
         assert len(remaining_reports) == 0
 
-    def test_bulk_delete_reports_unauthorized(self, authenticated_client, sample_user, test_db, db_refresh):
+    @pytest.mark.parametrize("preloaded_reports", ["both"], indirect=True)
+    @pytest.mark.asyncio
+    async def test_bulk_delete_reports_unauthorized(self, async_client, preloaded_reports):
         """Test bulk deletion fails when user doesn't own all reports."""
-        # Create another user
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        # Create scans for both users
-        user_scan = Scan(name="User Scan", user_id=sample_user.id, status=ScanStatus.COMPLETED)
-        other_scan = Scan(name="Other Scan", user_id=other_user.id, status=ScanStatus.COMPLETED)
-        test_db.add_all([user_scan, other_scan])
-        test_db.commit()
-        test_db.refresh(user_scan)
-        test_db.refresh(other_scan)
-        
-        # Create reports
-        user_report = Report(name="User Report", scan_id=user_scan.id, status="GENERATED")
-        other_report = Report(name="Other Report", scan_id=other_scan.id, status="GENERATED")
-        test_db.add_all([user_report, other_report])
-        test_db.commit()
-        test_db.refresh(user_report)
-        test_db.refresh(other_report)
-        
-        report_uuids = [user_report.uuid, other_report.uuid]
-        
-        response = authenticated_client.post("/api/reports/bulk-delete", json=report_uuids)
+        owned, others = preloaded_reports
+        report_uuids = [report.uuid for report in owned + others]
+        
+        response = await async_client.post("/api/reports/bulk-delete", json=report_uuids)
         
         assert response.status_code == status.HTTP_403_FORBIDDEN
         assert "Not authorized to delete report" in response.json()["detail"]
 
-    def test_bulk_delete_reports_empty_list(self, authenticated_client, sample_user):
+    def test_bulk_delete_reports_empty_list(self, mock_db_client, mock_db):
         """Test bulk deletion with empty list."""
-        response = authenticated_client.post("/api/reports/bulk-delete", json=[])
+        mock_db.query.return_value.filter.return_value.options.return_value.all.return_value = []
+        
+        response = mock_db_client.post("/api/reports/bulk-delete", json=[])
         
         assert response.status_code == status.HTTP_200_OK
         assert "0 report(s) deleted successfully" in response.json()["message"]
 
-    @patch('os.path.exists')
-    @patch('os.remove')
-    def test_delete_report_file_removal_failure(self, mock_remove, mock_exists, authenticated_client, test_db, sample_user, db_refresh):
+    @pytest.mark.asyncio
+    async def test_delete_report_file_removal_failure(self, report_os, async_client, test_db, download_scan):
         """Test report deletion when file removal fails."""
-        scan = Scan(
-            name="Test Scan",
-            user_id=sample_user.id,
-            status=ScanStatus.COMPLETED
-        )
-        test_db.add(scan)
-        test_db.commit()
-        test_db.refresh(scan)
-        
         report = Report(
             name="Test Report",
-            scan_id=scan.id,
-            status="GENERATED",
+            uuid=str(uuid.uuid4()),
+            scan_id=download_scan.id,
+            status=ReportStatus.GENERATED,
             url="/tmp/test-report.pdf"
         )
         test_db.add(report)
-        test_db.commit()
-        test_db.refresh(report)
+        test_db.flush()
         
-        mock_exists.return_value = True
-        mock_remove.side_effect = OSError("Permission denied")
+        report_os.path.exists.return_value = True
+        report_os.remove.side_effect = OSError("Permission denied")
         
-        response = authenticated_client.delete(f"/api/reports/{report.uuid}")
+        response = await async_client.delete(f"/api/reports/{report.uuid}")
         
         # Should still succeed even if file removal fails
         assert response.status_code == status.HTTP_200_OK
         assert "Report deleted successfully" in response.json()["message"]
+        report_os.remove.assert_called_once_with("/tmp/test-report.pdf")
 
-    def test_download_report_media_type_detection(self, authenticated_client, test_db, sample_user, db_refresh):
+    @pytest.mark.parametrize("report_type, type_value, expected_media_type", [
+        ("PDF", "pdf", "application/pdf"),
+        ("JSON", "json", "text/plain"),
+        ("CSV", "csv", "text/csv"),
+    ])
+    @pytest.mark.asyncio
+    async def test_download_report_media_type_detection(self, report_os, file_response, async_client, test_db, download_scan,
+                                                        report_type, type_value, expected_media_type):
         """Test that download sets correct media type based on report type."""
-        scan = Scan(
-            name="Test Scan",
-            user_id=sample_user.id,
-            status=ScanStatus.COMPLETED
+        report_os.path.exists.return_value = True
+        report = Report(
+            name=f"Test Report {report_type}",
+            uuid=str(uuid.uuid4()),
+            scan_id=download_scan.id,
+            status=ReportStatus.GENERATED,
+            url=f"/tmp/test-report.{type_value}",
+            type=ReportType(type_value)
         )
-        test_db.add(scan)
-        test_db.commit()
-        test_db.refresh(scan)
-        
-        test_cases = [
-            ("PDF", "pdf", "application/pdf"),
-            ("JSON", "json", "text/plain"),
-            ("CSV", "csv", "text/csv"),
-        ]
-        
-        for report_type, type_value, expected_media_type in test_cases:
-            with patch('os.path.exists', return_value=True):
-                with patch('app.api.routes.report.FileResponse') as mock_file_response:
-                    report = Report(
-                        name=f"Test Report {report_type}",
-                        scan_id=scan.id,
-                        status="GENERATED",
-                        url=f"/tmp/test-report.{type_value}",
-                        type=type_value
-                    )
-                    test_db.add(report)
-                    test_db.commit()
-                    test_db.refresh(report)
-                    
-                    response = authenticated_client.get(f"/api/reports/{report.uuid}/download")
-                    
-                    assert response.status_code == status.HTTP_200_OK
-                    # Verify correct media type was used
-                    call_args = mock_file_response.call_args
-                    assert call_args[1]["media_type"] == expected_media_type
-                    
-                    # Clean up for next iteration
-                    test_db.delete(report)
-                    test_db.commit()
-
-    def test_reports_require_authentication(self, client):
+        test_db.add(report)
+        test_db.flush()
+        
+        response = await async_client.get(f"/api/reports/{report.uuid}/download")
+        
+        assert response.status_code == status.HTTP_200_OK
+        # Verify correct media type was used
+        assert file_response.call_args.kwargs["media_type"] == expected_media_type
+
+    @pytest.mark.parametrize("method, endpoint", PROTECTED_ENDPOINTS)
+    def test_reports_require_authentication(self, unauthenticated_client, method, endpoint):
         """Test that all report endpoints require authentication."""
-        endpoints = [
-            ("GET", "/api/reports/"),
-            ("GET", "/api/reports/some-uuid"),
-            ("GET", "/api/reports/some-uuid/download"),
-            ("DELETE", "/api/reports/some-uuid"),
-            ("POST", "/api/reports/bulk-delete"),
-        ]
-        
-        for method, endpoint in endpoints:
-            if method == "GET":
-                response = client.get(endpoint)
-            elif method == "POST":
-                response = client.post(endpoint, json={})
-            elif method == "DELETE":
-                response = client.delete(endpoint)
-            
-            assert response.status_code in [401, 403, 422]  # Authentication required 
\ No newline at end of file
+        response = unauthenticated_client.request(method, endpoint, json={} if method == "POST" else None)
+        
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
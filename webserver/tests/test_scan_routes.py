@@ -1,15 +1,84 @@
 import pytest
-from unittest.mock import patch, Mock, AsyncMock
+from dataclasses import dataclass
+from unittest.mock import patch, AsyncMock, MagicMock
 from fastapi import status
+import httpx
 import json
-from app.models.user import User
 from app.models.scan import Scan, ScanStatus, ScanType, scan_target_association
 from app.models.target import Target
-from app.api.routes.scan import create_scan_entry, get_or_create_targets, start_openfaas_job
+from app.api.routes.scan import (
+    clean_target_list,
+    create_scan_entry,
+    get_or_create_targets,
+    is_private_ip,
+    post_openfaas_job,
+    start_openfaas_job,
+)
+from app.config import settings
+
+
+PROTECTED_ENDPOINTS = [
+    ("GET", "/api/scans/"),
+    ("GET", "/api/scans/some-uuid"),
+    ("GET", "/api/scans/some-uuid/status"),
+    ("GET", "/api/scans/some-uuid/findings"),
+    ("POST", "/api/scans/start"),
+    ("POST", "/api/scans/some-uuid/report"),
+    ("DELETE", "/api/scans/some-uuid"),
+    ("POST", "/api/scans/bulk-delete"),
+]
+
+
+@pytest.fixture
+def other_user_scan(test_db, user_factory):
+    """Another user and their completed scan."""
+    other_user = user_factory()
+    other_scan = Scan(
+        name="Other Scan",
+        user=other_user,
+        status=ScanStatus.COMPLETED,
+        uuid="other-scan-uuid"
+    )
+    test_db.add(other_scan)
+    test_db.flush()
+    return other_user, other_scan
+
+
+@dataclass
+class ScanExternals:
+    """Stand-ins for the services the scan routes call out to."""
+    start_openfaas_job: MagicMock
+    watch_scan: MagicMock
+    post_openfaas_job: MagicMock
+    redis: MagicMock  # the client returned by redis.Redis(...)
+
 
 class TestScanRoutes:
     """Test cases for scan routes."""
 
+    @pytest.fixture(autouse=True, scope="class")
+    def _patch_external(self):
+        """Replace OpenFaaS, Celery, Redis and outgoing HTTP once for the whole class."""
+        externals = ScanExternals(MagicMock(), MagicMock(), MagicMock(), MagicMock())
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr("app.api.routes.scan.start_openfaas_job", externals.start_openfaas_job)
+            mp.setattr("app.api.routes.scan.watch_scan", externals.watch_scan)
+            mp.setattr("app.api.routes.scan.post_openfaas_job", externals.post_openfaas_job)
+            mp.setattr("app.api.routes.scan.redis", MagicMock(**{"Redis.return_value": externals.redis}))
+            yield externals
+
+    @pytest.fixture(autouse=True)
+    def scan_externals(self, _patch_external):
+        """The class-wide external mocks with calls and configured results cleared.
+
+        Redis starts out empty: no progress value and no buffered output.
+        """
+        for external in vars(_patch_external).values():
+            external.reset_mock(return_value=True, side_effect=True)
+        _patch_external.redis.get.return_value = None
+        _patch_external.redis.lrange.return_value = []
+        return _patch_external
+
     def test_get_scans_empty_list(self, authenticated_client, sample_user):
         """Test getting scans when user has no scans."""
         response = authenticated_client.get("/api/scans/")
@@ -50,46 +119,24 @@ class TestScanRoutes:
         response = authenticated_client.get("/api/scans/nonexistent-uuid")
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
-        assert "Scan not found" in response.json()["detail"]
+        assert b"Scan not found" in response.content
 
-    def test_get_scan_unauthorized(self, authenticated_client, test_db):
+    def test_get_scan_unauthorized(self, authenticated_client, other_user_scan):
         """Test getting a scan that belongs to another user."""
-
-        
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_scan = Scan(
-            name="Other Scan",
-            user_id=other_user.id,
-            status=ScanStatus.PENDING
-        )
-        test_db.add(other_scan)
-        test_db.commit()
-        test_db.refresh(other_scan)
+        _, other_scan = other_user_scan
         
         response = authenticated_client.get(f"/api/scans/{other_scan.uuid}")
         
         assert response.status_code == status.HTTP_403_FORBIDDEN
-        assert "User not found" in response.json()["detail"]
+        assert b"User not found" in response.content
 
-    @patch('app.api.routes.scan.redis.Redis')
-    def test_get_scan_with_redis_progress(self, mock_redis_class, authenticated_client, sample_scan, test_db):
+    def test_get_scan_with_redis_progress(self, scan_externals, authenticated_client, sample_scan, test_db):
         """Test getting scan with real-time progress from Redis."""
-        # Mock Redis instance
-        mock_redis = Mock()
-        mock_redis_class.return_value = mock_redis
-        mock_redis.get.side_effect = lambda key: {
+        scan_externals.redis.get.side_effect = lambda key: {
             f"scan_progress:{sample_scan.uuid}": b"0.75",
             f"scan_output:{sample_scan.uuid}": None
         }.get(key)
-        mock_redis.lrange.return_value = [b"Scanning port 80", b"Found service HTTP"]
+        scan_externals.redis.lrange.return_value = [b"Scanning port 80", b"Found service HTTP"]
         
         response = authenticated_client.get(f"/api/scans/{sample_scan.uuid}")
         
@@ -115,7 +162,7 @@ class TestScanRoutes:
                 target_id=sample_target.id
             )
         )
-        test_db.commit()
+        test_db.flush()
         
         response = authenticated_client.get(f"/api/scans/{sample_scan.uuid}/findings")
         
@@ -126,11 +173,7 @@ class TestScanRoutes:
         finding_data = data["data"][0]
         assert finding_data["id"] == sample_finding.id
 
-    @patch('app.api.routes.scan.watch_scan.delay')
-    @patch('app.api.routes.scan.start_openfaas_job')
-    def test_start_scan_success(
-        self, mock_start_openfaas, mock_watch_scan, authenticated_client, test_data, test_db, sample_user, db_refresh
-    ):
+    def test_start_scan_success(self, scan_externals, authenticated_client, test_data, test_db, sample_user):
         """Test successful scan start."""
         scan_request = {
             "targets": ["example.com", "test.com"],
@@ -144,17 +187,15 @@ class TestScanRoutes:
         data = response.json()
         assert "scan_uuid" in data
 
-        db_refresh()
-        
         # Verify scan was created in database
         scan = test_db.query(Scan).filter(Scan.uuid == data["scan_uuid"]).first()
         assert scan is not None
         
         # Verify external calls were made
-        mock_start_openfaas.assert_called_once()
-        mock_watch_scan.assert_called_once_with(data["scan_uuid"])
+        scan_externals.start_openfaas_job.assert_called_once()
+        scan_externals.watch_scan.delay.assert_called_once_with(data["scan_uuid"])
 
-    def test_start_scan_with_private_ips_filtered(self, authenticated_client, sample_user):
+    def test_start_scan_with_private_ips_filtered(self, scan_externals, authenticated_client, sample_user):
         """Test that private IPs are filtered out from scan targets."""
         scan_request = {
             "targets": ["192.168.1.1", "10.0.0.1", "example.com", "172.16.1.1"],
@@ -162,14 +203,12 @@ class TestScanRoutes:
             "scan_options": {}
         }
         
-        with patch('app.api.routes.scan.start_openfaas_job') as mock_openfaas:
-            with patch('app.api.routes.scan.watch_scan.delay'):
-                response = authenticated_client.post("/api/scans/start", json=scan_request)
+        response = authenticated_client.post("/api/scans/start", json=scan_request)
         
         assert response.status_code == status.HTTP_200_OK
         
         # Verify that only example.com was passed to OpenFaaS (private IPs filtered)
-        call_args = mock_openfaas.call_args[0][0]
+        call_args = scan_externals.start_openfaas_job.call_args[0][0]
         assert "example.com" in call_args["targets"]
         assert "192.168.1.1" not in call_args["targets"]
         assert "10.0.0.1" not in call_args["targets"]
@@ -183,13 +222,10 @@ class TestScanRoutes:
         
         assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
-    @patch('app.api.routes.scan.requests.post')
-    def test_start_openfaas_job_success(self, mock_post):
+    def test_start_openfaas_job_success(self, scan_externals):
         """Test OpenFaaS job start function."""
-        
-        
-        mock_post.return_value.status_code = 202
-        mock_post.return_value.text = "Job started"
+        mock_post = scan_externals.post_openfaas_job
+        mock_post.return_value = httpx.Response(202, text="Job started")
         
         payload = {
             "targets": ["example.com"],
@@ -201,15 +237,32 @@ class TestScanRoutes:
         start_openfaas_job(payload)
         
         mock_post.assert_called_once()
-        call_args = mock_post.call_args
-        assert call_args[0][0].endswith("/async-function/dummy")
-        assert call_args[1]["json"] == payload
+        faas_payload, headers = mock_post.call_args.args
+        assert faas_payload == payload
+        assert headers["X-Callback-Url"].endswith("/api/scans/hook")
+
+    def test_post_openfaas_job_request(self, monkeypatch):
+        """Test the request post_openfaas_job sends to the async OpenFaaS function."""
+        fake_httpx = MagicMock()
+        fake_httpx.post.return_value = httpx.Response(202, text="Job started")
+        monkeypatch.setattr("app.api.routes.scan.httpx", fake_httpx)
+        payload = {"targets": ["example.com"], "scan_id": "test-uuid"}
+        headers = {"X-Callback-Url": "http://callback/api/scans/hook"}
+
+        response = post_openfaas_job(payload, headers)
+
+        assert response.status_code == 202
+        fake_httpx.post.assert_called_once_with(
+            settings.OPENFAAS_ASYNC_FUNCTION_URL,
+            json=payload,
+            headers=headers,
+            timeout=30
+        )
+        assert settings.OPENFAAS_ASYNC_FUNCTION_URL.endswith("/async-function/dummy")
 
-    @patch('app.api.routes.scan.requests.post')
-    def test_start_openfaas_job_failure(self, mock_post):
+    def test_start_openfaas_job_failure(self, scan_externals):
         """Test OpenFaaS job start with failure."""
-        
-        mock_post.side_effect = Exception("Connection failed")
+        scan_externals.post_openfaas_job.side_effect = httpx.ConnectError("Connection failed")
         
         payload = {
             "targets": ["example.com"],
@@ -221,94 +274,82 @@ class TestScanRoutes:
         # Should not raise exception, just log error
         start_openfaas_job(payload)
 
-    def test_clean_target_list_function(self):
+    @pytest.mark.parametrize("target, kept", [
+        ("http://example.com/", "example.com"),
+        ("https://test.com", "test.com"),
+        ("google.com", "google.com"),
+        ("8.8.8.8", "8.8.8.8"),
+        ("8.8.8.8-8.8.8.10", "8.8.8.8-8.8.8.10"),
+        ("192.168.1.1", None),  # Private IP
+        ("10.0.0.0/24", None),  # Private network
+        ("172.16.1.1-172.16.1.10", None),  # Private range
+        ("", None),
+    ])
+    def test_clean_target_list_function(self, target, kept):
         """Test the clean_target_list utility function."""
-        from app.api.routes.scan import clean_target_list
-        
-        targets = [
-            "http://example.com/",
-            "https://test.com",
-            "192.168.1.1",  # Private IP - should be filtered
-            "10.0.0.0/24",  # Private network - should be filtered
-            "google.com",
-            "172.16.1.1-172.16.1.10",  # Private range - should be filtered
-            "",  # Empty - should be filtered
-            "8.8.8.8",
-            "8.8.8.8-8.8.8.10"
-        ]
-        
-        cleaned = clean_target_list(targets)
-        
-        assert "example.com" in cleaned
-        assert "test.com" in cleaned
-        assert "google.com" in cleaned
-        assert "8.8.8.8" in cleaned
-        assert "8.8.8.8-8.8.8.10" in cleaned
-        assert "192.168.1.1" not in cleaned
-        assert "10.0.0.0/24" not in cleaned
-        assert "172.16.1.1-172.16.1.10" not in cleaned
-
-    def test_is_private_ip_function(self):
+        assert clean_target_list([target]) == ([kept] if kept else [])
+
+    @pytest.mark.parametrize("addr, expected", [
+        ("192.168.1.1", True),
+        ("10.0.0.1", True),
+        ("172.16.1.1", True),
+        ("8.8.8.8", False),
+        ("1.1.1.1", False),
+        ("invalid", False),
+    ])
+    def test_is_private_ip_function(self, addr, expected):
         """Test the is_private_ip utility function."""
-        from app.api.routes.scan import is_private_ip
-        
-        assert is_private_ip("192.168.1.1") is True
+        assert is_private_ip(addr) is expected
+
+    def test_is_private_ip_caches_repeated_lookups(self):
+        """Test that a repeated address is answered from is_private_ip's cache."""
+        is_private_ip.cache_clear()
+        assert is_private_ip("10.0.0.1") is True
+        hits = is_private_ip.cache_info().hits
+
         assert is_private_ip("10.0.0.1") is True
-        assert is_private_ip("172.16.1.1") is True
-        assert is_private_ip("8.8.8.8") is False
-        assert is_private_ip("1.1.1.1") is False
-        assert is_private_ip("invalid") is False
+        assert is_private_ip.cache_info().hits == hits + 1
 
     @pytest.mark.asyncio
-    async def test_scan_hook_success(self, authenticated_client, sample_scan, test_db):
+    async def test_scan_hook_success(self, async_client, sample_scan, test_db):
         """Test successful scan webhook."""
         hook_data = {
             "scan_id": sample_scan.uuid,
             "status": "completed"
         }
         
-        response = authenticated_client.post("/api/scans/hook", json=hook_data)
+        response = await async_client.post("/api/scans/hook", json=hook_data)
         
         assert response.status_code == status.HTTP_200_OK
         assert response.json()["success"] is True
         
         # Verify scan status was updated
         test_db.refresh(sample_scan)
-        assert sample_scan.status.value == "pending"
+        assert sample_scan.status == ScanStatus.COMPLETED
 
     @pytest.mark.asyncio
-    async def test_scan_hook_scan_not_found(self, authenticated_client):
+    async def test_scan_hook_scan_not_found(self, async_client):
         """Test scan webhook with non-existent scan."""
         hook_data = {
             "scan_id": "nonexistent-uuid",
             "status": "completed"
         }
         
-        response = authenticated_client.post("/api/scans/hook", json=hook_data)
+        response = await async_client.post("/api/scans/hook", json=hook_data)
         
         assert response.status_code == status.HTTP_200_OK
         assert "Scan not found" in response.json()["error"]
 
-    def test_delete_scan_success(self, authenticated_client, sample_user, test_db, db_refresh):
+    def test_delete_scan_success(self, authenticated_client, sample_user, test_db, scan_factory):
         """Test successful scan deletion."""
-
-        scan = Scan(
-            name="Test Scan",
-            user_id=sample_user.id,
-            status=ScanStatus.COMPLETED,
-            uuid="test-uuid"
-        )
-        test_db.add(scan)
-        test_db.commit()
+        scan, = scan_factory(sample_user, status=ScanStatus.COMPLETED)
 
         response = authenticated_client.delete(f"/api/scans/{scan.uuid}")
         
         assert response.status_code == status.HTTP_200_OK
         assert "Scan deleted successfully" in response.json()["message"]
-        
-        db_refresh()
-        scan = test_db.query(Scan).filter(Scan.uuid == "test-uuid").first()
-        assert scan is None
+
+        assert test_db.query(Scan).filter(Scan.uuid == scan.uuid).first() is None
 
     def test_delete_scan_not_found(self, authenticated_client, sample_user):
         """Test deleting a scan that doesn't exist."""
@@ -316,43 +357,17 @@ class TestScanRoutes:
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
-    def test_delete_scan_unauthorized(self, authenticated_client, test_db, sample_user):
+    def test_delete_scan_unauthorized(self, authenticated_client, sample_user, other_user_scan):
         """Test deleting a scan that belongs to another user."""
-        
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_scan = Scan(
-            name="Other Scan",
-            user_id=other_user.id,
-            status=ScanStatus.COMPLETED,
-            uuid="test-uuid"
-        )
-        test_db.add(other_scan)
-        test_db.commit()
-        test_db.refresh(other_scan)
+        _, other_scan = other_user_scan
         
         response = authenticated_client.delete(f"/api/scans/{other_scan.uuid}")
         
         assert response.status_code == status.HTTP_403_FORBIDDEN
 
-    def test_bulk_delete_scans_success(self, authenticated_client, sample_user, test_db, db_refresh):
+    def test_bulk_delete_scans_success(self, authenticated_client, sample_user, test_db, scan_factory):
         """Test successful bulk deletion of scans."""
-        scans = [
-            Scan(name="Scan 1", user_id=sample_user.id, status=ScanStatus.PENDING, uuid="test-uuid-1"),
-            Scan(name="Scan 2", user_id=sample_user.id, status=ScanStatus.PENDING, uuid="test-uuid-2"),
-            Scan(name="Scan 3", user_id=sample_user.id, status=ScanStatus.PENDING, uuid="test-uuid-3")
-        ]
-        test_db.add_all(scans)
-        test_db.commit()
-        for scan in scans:
-            test_db.refresh(scan)
+        scans = scan_factory(sample_user, n=3)
         
         scan_uuids = [scan.uuid for scan in scans]
         
@@ -361,35 +376,20 @@ class TestScanRoutes:
         assert response.status_code == status.HTTP_200_OK
         assert "Scans deleted successfully" in response.json()["message"]
 
-        db_refresh()
-
         remaining_scans = test_db.query(Scan).filter(Scan.uuid.in_(scan_uuids)).all()
         assert len(remaining_scans) == 0
 
-    def test_bulk_delete_scans_unauthorized(self, authenticated_client, sample_user, test_db):
+    def test_bulk_delete_scans_unauthorized(self, authenticated_client, sample_user, scan_factory, other_user_scan):
         """Test bulk deletion fails when user doesn't own all scans."""
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        user_scan = Scan(name="User Scan", user_id=sample_user.id, status=ScanStatus.COMPLETED, uuid="test-uuid-1")
-        other_scan = Scan(name="Other Scan", user_id=other_user.id, status=ScanStatus.COMPLETED, uuid="test-uuid-2")
-        test_db.add_all([user_scan, other_scan])
-        test_db.commit()
-        test_db.refresh(user_scan)
-        test_db.refresh(other_scan)
+        user_scan, = scan_factory(sample_user, status=ScanStatus.COMPLETED)
+        _, other_scan = other_user_scan
         
         scan_uuids = [user_scan.uuid, other_scan.uuid]
         
         response = authenticated_client.post("/api/scans/bulk-delete", json=scan_uuids)
         
         assert response.status_code == status.HTTP_403_FORBIDDEN
-        assert "Not authorized to delete scan" in response.json()["detail"]
+        assert b"Not authorized to delete scan" in response.content
 
     def test_get_or_create_targets_function(self, test_db, sample_user):
         """Test the get_or_create_targets utility function."""
@@ -422,28 +422,12 @@ class TestScanRoutes:
         assert scan.name == "Assessment no. 1"
         assert sample_target in scan.targets
 
-    def test_scans_require_authentication(self, client):
+    @pytest.mark.parametrize("method, endpoint", PROTECTED_ENDPOINTS)
+    def test_scans_require_authentication(self, unauthenticated_client, method, endpoint):
         """Test that all scan endpoints require authentication."""
-        endpoints = [
-            ("GET", "/api/scans/"),
-            ("GET", "/api/scans/some-uuid"),
-            ("GET", "/api/scans/some-uuid/status"),
-            ("GET", "/api/scans/some-uuid/findings"),
-            ("POST", "/api/scans/start"),
-            ("POST", "/api/scans/some-uuid/report"),
-            ("DELETE", "/api/scans/some-uuid"),
-            ("POST", "/api/scans/bulk-delete"),
-        ]
-        
-        for method, endpoint in endpoints:
-            if method == "GET":
-                response = client.get(endpoint)
-            elif method == "POST":
-                response = client.post(endpoint, json={})
-            elif method == "DELETE":
-                response = client.delete(endpoint)
-            
-            assert response.status_code in [401, 403, 422]  # Authentication required
+        response = unauthenticated_client.request(method, endpoint, json={} if method == "POST" else None)
+        
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
 
 class TestScanWebSocketFunctionality:
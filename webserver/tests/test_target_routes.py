@@ -1,10 +1,33 @@
 import pytest
-from unittest.mock import patch, Mock, AsyncMock
 from fastapi import status
-import json
-from app.models.user import User
+from sqlalchemy import exists, func, select
+import socket
 from app.models.target import Target
-from app.models.scan import Scan, ScanStatus, scan_target_association
+from app.models.finding import Finding, Severity
+from app.models.scan import Scan, ScanStatus
+from app.api.routes.target import resolve_target_ip
+
+
+PROTECTED_ENDPOINTS = [
+    ("GET", "/api/targets/"),
+    ("GET", "/api/targets/some-uuid"),
+    ("GET", "/api/targets/some-uuid/flag"),
+    ("POST", "/api/targets/"),
+    ("PUT", "/api/targets/some-uuid"),
+    ("DELETE", "/api/targets/some-uuid"),
+    ("POST", "/api/targets/bulk-delete"),
+]
+
+
+@pytest.fixture
+def other_user_target(test_db, user_factory):
+    """Another user and their target."""
+    other_user = user_factory()
+    other_target = Target(name="other-target.com", user=other_user)
+    test_db.add(other_target)
+    test_db.flush()
+    return other_user, other_target
+
 
 class TestTargetRoutes:
     """Test cases for target routes."""
@@ -18,6 +41,7 @@ class TestTargetRoutes:
         assert "data" in data
         assert data["data"] == []
 
+    @pytest.mark.usefixtures("raise_on_lazy_load")
     def test_get_targets_with_data(self, authenticated_client, sample_user, sample_target, test_db):
         """Test getting targets when user has targets."""
         response = authenticated_client.get("/api/targets/")
@@ -37,29 +61,18 @@ class TestTargetRoutes:
         assert "created_at" in target_data
         assert "updated_at" in target_data
 
+    @pytest.mark.usefixtures("raise_on_lazy_load")
     def test_get_targets_with_findings_and_scans(
         self, authenticated_client, sample_user, sample_target, sample_finding, test_db
     ):
         """Test that target list includes correct counts for findings and scans."""
-        # Create a scan and associate it with the target
-        
-        scan = Scan(
+        test_db.add(Scan(
             name="Test Scan",
             user_id=sample_user.id,
-            status=ScanStatus.COMPLETED
-        )
-        test_db.add(scan)
-        test_db.commit()
-        test_db.refresh(scan)
-        
-        # Associate scan with target
-        test_db.execute(
-            scan_target_association.insert().values(
-                scan_id=scan.id,
-                target_id=sample_target.id
-            )
-        )
-        test_db.commit()
+            status=ScanStatus.COMPLETED,
+            targets=[sample_target]
+        ))
+        test_db.flush()
         
         response = authenticated_client.get("/api/targets/")
         
@@ -69,6 +82,35 @@ class TestTargetRoutes:
         assert target_data["findings_count"] == 1  # from sample_finding
         assert target_data["completed_scans_count"] == 1
 
+    @pytest.mark.usefixtures("raise_on_lazy_load")
+    def test_get_targets_counts_in_constant_queries(self, authenticated_client, sample_user, test_db, sql_counter):
+        """Test that listing targets does not issue per-target count queries."""
+        targets = [Target(name=f"target{i}.com", user_id=sample_user.id) for i in range(10)]
+        for i, target in enumerate(targets):
+            target.findings = [
+                Finding(name=f"Finding {j}", severity=Severity.LOW, port=80, service="http")
+                for j in range(i % 3)
+            ]
+        test_db.add_all(targets)
+        test_db.add_all([
+            Scan(name="Completed Scan", user_id=sample_user.id, status=ScanStatus.COMPLETED, targets=targets[:4]),
+            Scan(name="Running Scan", user_id=sample_user.id, status=ScanStatus.RUNNING, targets=targets),
+        ])
+        test_db.flush()
+        expected = {
+            target.uuid: (i % 3, 1 if i < 4 else 0) for i, target in enumerate(targets)
+        }
+
+        sql_counter.clear()
+        response = authenticated_client.get("/api/targets/")
+
+        assert response.status_code == status.HTTP_200_OK
+        counts = {
+            t["uuid"]: (t["findings_count"], t["completed_scans_count"]) for t in response.json()["data"]
+        }
+        assert counts == expected
+        assert sql_counter.select_count <= 3
+
     def test_get_target_by_uuid(self, authenticated_client, sample_user, sample_target):
         """Test getting a specific target by UUID."""
         response = authenticated_client.get(f"/api/targets/{sample_target.uuid}")
@@ -80,54 +122,45 @@ class TestTargetRoutes:
         assert data["name"] == sample_target.name
         assert data["user_id"] == sample_user.id
 
-    def test_get_target_not_found(self, authenticated_client, sample_user):
-        """Test getting a target that doesn't exist."""
-        response = authenticated_client.get("/api/targets/nonexistent-uuid")
+    @pytest.mark.parametrize("method", ["GET", "PUT", "DELETE"])
+    def test_target_not_found(self, authenticated_client, sample_user, method):
+        """Test reading, updating or deleting a target that doesn't exist."""
+        body = {"name": "updated-target.com"} if method == "PUT" else None
+        
+        response = authenticated_client.request(method, "/api/targets/nonexistent-uuid", json=body)
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert "Target not found" in response.json()["detail"]
 
-    def test_get_target_unauthorized(self, authenticated_client, test_db, sample_user):
-        """Test getting a target that belongs to another user."""
-        # Create another user and target
+    @pytest.mark.parametrize("method", ["GET", "PUT", "DELETE"])
+    def test_target_of_other_user_forbidden(self, authenticated_client, sample_user, other_user_target, method):
+        """Test that another user's target cannot be read, updated or deleted."""
+        _, other_target = other_user_target
+        body = {"name": "updated-target.com"} if method == "PUT" else None
         
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_target = Target(
-            name="other-target.com",
-            user_id=other_user.id,
-            uuid="test-uuid"
-        )
-        test_db.add(other_target)
-        test_db.commit()
-        test_db.refresh(other_target)
-        
-        response = authenticated_client.get(f"/api/targets/{other_target.uuid}")
+        response = authenticated_client.request(method, f"/api/targets/{other_target.uuid}", json=body)
         
         assert response.status_code == status.HTTP_403_FORBIDDEN
         assert "Not authorized" in response.json()["detail"]
 
-    @patch('socket.gethostbyname')
-    def test_get_target_flag_dns_resolution_failure(
-        self, mock_gethostbyname, authenticated_client, sample_target
-    ):
+    def test_get_target_flag_dns_resolution_failure(self, monkeypatch, authenticated_client, sample_target):
         """Test target flag when DNS resolution fails."""
-        import socket
-        mock_gethostbyname.side_effect = socket.gaierror("Name resolution failed")
-        
+        monkeypatch.setattr("app.api.routes.target.resolve_target_ip", lambda hostname: None)
+
         response = authenticated_client.get(f"/api/targets/{sample_target.uuid}/flag")
         
         assert response.status_code == status.HTTP_200_OK
         assert response.json() is None
 
-    def test_create_target_success(self, authenticated_client, test_data, test_db, sample_user, db_refresh):
+    def test_resolve_target_ip_returns_none_on_dns_failure(self, monkeypatch):
+        """Test that an unresolvable name resolves to None instead of raising."""
+        def fail(hostname):
+            raise socket.gaierror("Name resolution failed")
+        monkeypatch.setattr("app.api.routes.target.socket.gethostbyname", fail)
+
+        assert resolve_target_ip("unresolvable.example") is None
+
+    def test_create_target_success(self, authenticated_client, test_data, test_db, sample_user):
         """Test successful target creation."""
         response = authenticated_client.post(
             "/api/targets/", 
@@ -136,8 +169,6 @@ class TestTargetRoutes:
         
         assert response.status_code == status.HTTP_200_OK
 
-        db_refresh()
-
         data = response.json()
         assert data["name"] == test_data.VALID_TARGET_DATA["name"]
         assert "id" in data
@@ -146,8 +177,8 @@ class TestTargetRoutes:
         assert "updated_at" in data
         
         # Verify target was created in database
-        target = test_db.query(Target).filter(Target.name == test_data.VALID_TARGET_DATA["name"]).first()
-        assert target is not None
+        target_id = test_db.scalar(select(Target.id).where(Target.name == test_data.VALID_TARGET_DATA["name"]))
+        assert target_id == data["id"]
 
     def test_create_target_duplicate_name(
         self, authenticated_client, sample_target, test_data, sample_user
@@ -182,70 +213,26 @@ class TestTargetRoutes:
         assert data["name"] == update_data["name"]
         assert data["uuid"] == sample_target.uuid
 
-    def test_update_target_not_found(self, authenticated_client, sample_user):
-        """Test updating a target that doesn't exist."""
-        update_data = {"name": "updated-target.com"}
-        
-        response = authenticated_client.put(
-            "/api/targets/nonexistent-uuid", 
-            json=update_data
-        )
-        
-        assert response.status_code == status.HTTP_404_NOT_FOUND
-
-    def test_update_target_unauthorized(self, authenticated_client, test_db, sample_user):
-        """Test updating a target that belongs to another user."""
-        # Create another user and target
-        
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_target = Target(
-            name="other-target.com",
-            user_id=other_user.id
-        )
-        test_db.add(other_target)
-        test_db.commit()
-        test_db.refresh(other_target)
-        
-        update_data = {"name": "updated-target.com"}
-        response = authenticated_client.put(
-            f"/api/targets/{other_target.uuid}", 
-            json=update_data
-        )
-        
-        assert response.status_code == status.HTTP_403_FORBIDDEN
-
     def test_update_target_duplicate_name(
-        self, authenticated_client, sample_user, test_db, db_refresh
+        self, authenticated_client, sample_user, bulk_insert
     ):
         """Test updating target to a name that already exists."""
         # Create two targets for the same user
-        
-        target1 = Target(name="target1.com", user_id=sample_user.id)
-        target2 = Target(name="target2.com", user_id=sample_user.id)
-        test_db.add_all([target1, target2])
-        test_db.commit()
-        test_db.refresh(target1)
-        test_db.refresh(target2)
+        _, (target2_uuid,) = bulk_insert(Target, [
+            {"name": "target1.com", "user_id": sample_user.id},
+            {"name": "target2.com", "user_id": sample_user.id},
+        ], Target.uuid)
         
         # Try to update target2 to have the same name as target1
         update_data = {"name": "target1.com"}
         response = authenticated_client.put(
-            f"/api/targets/{target2.uuid}", 
+            f"/api/targets/{target2_uuid}", 
             json=update_data
         )
-        db_refresh()
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert "Target with this name already exists" in response.json()["detail"]
 
-    def test_delete_target_success(self, authenticated_client, sample_target, test_db, db_refresh):
+    def test_delete_target_success(self, authenticated_client, sample_target, test_db):
         """Test successful target deletion."""
         target_uuid = sample_target.uuid
         
@@ -253,102 +240,46 @@ class TestTargetRoutes:
         
         assert response.status_code == status.HTTP_200_OK
         assert "Target deleted successfully" in response.json()["message"]
-        db_refresh()
-        # Verify target was deleted from database
-        
-        target = test_db.query(Target).filter(Target.uuid == target_uuid).first()
-        assert target is None
-
-    def test_delete_target_not_found(self, authenticated_client, sample_user):
-        """Test deleting a target that doesn't exist."""
-        response = authenticated_client.delete("/api/targets/nonexistent-uuid")
-        
-        assert response.status_code == status.HTTP_404_NOT_FOUND
 
-    def test_delete_target_unauthorized(self, authenticated_client, test_db, sample_user):
-        """Test deleting a target that belongs to another user."""
-        # Create another user and target
-        
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
-        other_target = Target(
-            name="other-target.com",
-            user_id=other_user.id
-        )
-        test_db.add(other_target)
-        test_db.commit()
-        test_db.refresh(other_target)
-        
-        response = authenticated_client.delete(f"/api/targets/{other_target.uuid}")
-        
-        assert response.status_code == status.HTTP_403_FORBIDDEN
+        # Verify target was deleted from database
+        assert not test_db.scalar(select(exists().where(Target.uuid == target_uuid)))
 
     def test_bulk_delete_targets_success(
-        self, authenticated_client, sample_user, test_db, db_refresh, sample_target
+        self, authenticated_client, sample_user, test_db, bulk_insert, sample_target
     ):
         """Test successful bulk deletion of targets."""
-        # Create multiple targets
-        
-        targets = [
-            Target(name="target1.com", user_id=sample_user.id, uuid="test-uuid-1"),
-            Target(name="target2.com", user_id=sample_user.id, uuid="test-uuid-2"),
-            Target(name="target3.com", user_id=sample_user.id, uuid="test-uuid-3")
-        ]
-        test_db.add_all(targets)
-        test_db.commit()
-        for target in targets:
-            test_db.refresh(target)
-        
         target_uuids = ["test-uuid-1", "test-uuid-2", "test-uuid-3"]
+        bulk_insert(Target, [
+            {"name": f"target{i}.com", "user_id": sample_user.id, "uuid": target_uuid}
+            for i, target_uuid in enumerate(target_uuids, start=1)
+        ])
         
         response = authenticated_client.post(
             "/api/targets/bulk-delete", 
             json=target_uuids
         )
-        db_refresh()
         assert response.status_code == status.HTTP_200_OK
         assert "Targets and associated findings deleted successfully" in response.json()["message"]
         
         # Verify targets were deleted
-        remaining_targets = test_db.query(Target).filter(Target.uuid.in_(target_uuids)).all()
-        assert len(remaining_targets) == 0
+        remaining = test_db.scalar(select(func.count()).select_from(Target).where(Target.uuid.in_(target_uuids)))
+        assert remaining == 0
 
     def test_bulk_delete_targets_unauthorized(
-        self, authenticated_client, sample_user, test_db, db_refresh
+        self, authenticated_client, sample_user, test_db, other_user_target
     ):
         """Test bulk deletion fails when user doesn't own all targets."""
-        # Create targets for different users
-        
-        other_user = User(
-            keycloak_uuid="other-user-uuid",
-            username="otheruser",
-            email="other@example.com"
-        )
-        test_db.add(other_user)
-        test_db.commit()
-        test_db.refresh(other_user)
-        
+        _, other_target = other_user_target
         user_target = Target(name="user-target.com", user_id=sample_user.id, uuid="test-uuid-1")
-        other_target = Target(name="other-target.com", user_id=other_user.id, uuid="test-uuid-2")
-        test_db.add_all([user_target, other_target])
-        test_db.commit()
-        test_db.refresh(user_target)
-        test_db.refresh(other_target)
+        test_db.add(user_target)
+        test_db.flush()
         
-        target_uuids = ["test-uuid-1", "test-uuid-2"]
+        target_uuids = [user_target.uuid, other_target.uuid]
         
         response = authenticated_client.post(
             "/api/targets/bulk-delete", 
             json=target_uuids
         )
-        db_refresh()
         assert response.status_code == status.HTTP_403_FORBIDDEN
         assert "Not authorized to delete target" in response.json()["detail"]
 
@@ -358,26 +289,9 @@ class TestTargetRoutes:
         
         assert response.status_code == status.HTTP_200_OK
 
-    def test_targets_require_authentication(self, client):
+    @pytest.mark.parametrize("method, endpoint", PROTECTED_ENDPOINTS)
+    def test_targets_require_authentication(self, unauthenticated_client, method, endpoint):
         """Test that all target endpoints require authentication."""
-        endpoints = [
-            ("GET", "/api/targets/"),
-            ("GET", "/api/targets/some-uuid"),
-            ("GET", "/api/targets/some-uuid/flag"),
-            ("POST", "/api/targets/"),
-            ("PUT", "/api/targets/some-uuid"),
-            ("DELETE", "/api/targets/some-uuid"),
-            ("POST", "/api/targets/bulk-delete"),
-        ]
+        response = unauthenticated_client.request(method, endpoint, json={} if method in ("POST", "PUT") else None)
         
-        for method, endpoint in endpoints:
-            if method == "GET":
-                response = client.get(endpoint)
-            elif method == "POST":
-                response = client.post(endpoint, json={})
-            elif method == "PUT":
-                response = client.put(endpoint, json={})
-            elif method == "DELETE":
-                response = client.delete(endpoint)
-            
-            assert response.status_code in [401, 403, 422]  # Authentication required 
\ No newline at end of file
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED